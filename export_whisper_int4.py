@@ -0,0 +1,50 @@
+"""Offline export of whisper-base to ONNX with INT4 weight-only decoders.
+
+Needs optimum[onnxruntime] and neural-compressor.  Run once on the
+deployment host; main.py loads the result from ONNX_INT4_DIR on CPU-only
+machines:
+
+    python export_whisper_int4.py
+"""
+import glob
+import os
+
+from neural_compressor import PostTrainingQuantConfig, quantization
+from optimum.exporters.onnx import main_export
+
+MODEL_ID = "openai/whisper-base"
+OUTPUT_DIR = "models/whisper-base-int4-onnx"  # ONNX_INT4_DIR in main.py
+
+# Round-to-nearest, symmetric 4-bit weights in groups of 32; needs no
+# calibration data and maps onto ONNX Runtime's 4-bit MatMul kernels
+QUANT_CONFIG = PostTrainingQuantConfig(
+    approach="weight_only",
+    op_type_dict={
+        ".*": {
+            "weight": {
+                "bits": 4,
+                "algorithm": ["RTN"],
+                "scheme": ["sym"],
+                "group_size": 32
+            }
+        }
+    }
+)
+
+def main():
+    main_export(
+        MODEL_ID,
+        output=OUTPUT_DIR,
+        task="automatic-speech-recognition-with-past",
+        # Skip writing decoder_model_merged.onnx: its MatMuls sit inside If
+        # subgraphs, and main.py loads the two plain decoders instead
+        no_post_process=True
+    )
+    # Only the decoders run once per generated token; the encoder stays FP32
+    for model_path in sorted(glob.glob(os.path.join(OUTPUT_DIR, "decoder*.onnx"))):
+        print(f"Quantizing {model_path}")
+        q_model = quantization.fit(model_path, QUANT_CONFIG)
+        q_model.save(model_path)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
 import streamlit as st
-from transformers import pipeline
-import tempfile
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import ctranslate2
+from faster_whisper import WhisperModel, decode_audio
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+import numpy as np
+import torch
+from scipy.signal import resample_poly
+from transformers import AutoProcessor, LogitsProcessor, LogitsProcessorList
+import copy
+import hashlib
+import io
 import os
 import re
+import struct
+import threading
+import time
+import wave
+import xxhash
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
 from audio_recorder_streamlit import audio_recorder
+import model_registry
 
 # Configuration
 VIDEO_MAPPING = {
@@ -12,57 +31,400 @@ VIDEO_MAPPING = {
     "no": "videos/no.mp4"  # Verify this file exists
 }
 
-@st.cache_resource
+SAMPLE_RATE = 16000
+OV_MODEL_ID = "OpenVINO/whisper-tiny-int8-ov"
+# Written by export_whisper_int4.py; preferred over OpenVINO when present
+ONNX_INT4_DIR = "models/whisper-base-int4-onnx"
+# show_results only looks at the first word, so a few tokens are enough
+MAX_NEW_TOKENS = 4
+# Concurrent requests are grouped into one model call of up to BATCH_SIZE
+# recordings, waiting at most BATCH_WINDOW_S for the batch to fill
+BATCH_SIZE = 8
+BATCH_WINDOW_S = 0.05
+# Bytes hashed from each end of a recording to spot a repeated submission
+QUICK_HASH_BYTES = 4096
+# Commands are a single short word, so close speech regions quickly
+VAD_OPTIONS = VadOptions(min_silence_duration_ms=300, speech_pad_ms=200)
+_PUNCT_RE = re.compile(r'[^\w\s]')
+# RIFF/WAVE header with a 16-byte fmt chunk directly followed by data
+_CANONICAL_WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+def keyword_variants():
+    """Spellings of the VIDEO_MAPPING keys as Whisper tends to emit them"""
+    return [
+        prefix + form
+        for word in VIDEO_MAPPING
+        for form in (word, word.capitalize())
+        for prefix in ("", " ")
+    ]
+
+class AllowedTokensProcessor(LogitsProcessor):
+    """Mask every logit except the given token ids"""
+
+    def __init__(self, allowed_ids):
+        self.allowed_ids = torch.tensor(sorted(allowed_ids))
+
+    def __call__(self, input_ids, scores):
+        mask = torch.full_like(scores, float("-inf"))
+        mask[:, self.allowed_ids] = 0
+        return scores + mask
+
+class CT2Recognizer:
+    """whisper-base on faster-whisper, used when a CUDA device is present"""
+
+    def __init__(self):
+        # CTranslate2 build of whisper-base with int8 weights: decoding a single
+        # word is bound by weight loads, so smaller weights mean lower latency
+        self.model = WhisperModel(
+            "base",
+            device="auto",
+            compute_type="int8"
+        )
+        # Suppress every text token that cannot spell a keyword, turning
+        # open-vocabulary decoding into a choice between the known words
+        hf_tokenizer = self.model.hf_tokenizer
+        allowed_ids = {
+            token_id
+            for variant in keyword_variants()
+            for token_id in hf_tokenizer.encode(variant, add_special_tokens=False).ids
+        }
+        # Special and timestamp tokens are masked too, matching the HF
+        # path; EOT stays so decoding can stop after the keyword
+        allowed_ids.add(hf_tokenizer.token_to_id("<|endoftext|>"))
+        self.suppress_tokens = [
+            i for i in range(hf_tokenizer.get_vocab_size()) if i not in allowed_ids
+        ]
+
+        self.tokenizer = Tokenizer(
+            hf_tokenizer,
+            self.model.model.is_multilingual,
+            task="transcribe",
+            language="en"
+        )
+        self.prompt = list(self.tokenizer.sot_sequence) + [self.tokenizer.no_timestamps]
+
+    def transcribe_batch(self, audio_arrays):
+        # WhisperModel.transcribe handles one recording at a time, so batch
+        # the padded log-mel windows and call CTranslate2 directly
+        features = np.stack([
+            pad_or_trim(self.model.feature_extractor(audio_array))
+            for audio_array in audio_arrays
+        ]).astype(np.float32, copy=False)
+        results = self.model.model.generate(
+            ctranslate2.StorageView.from_array(features),
+            [self.prompt] * len(audio_arrays),
+            beam_size=1,
+            max_length=len(self.prompt) + MAX_NEW_TOKENS,
+            suppress_tokens=self.suppress_tokens
+        )
+        return [self.tokenizer.decode(result.sequences_ids[0]) for result in results]
+
+class OptimumRecognizer:
+    """Whisper exported through Optimum (OpenVINO or ONNX Runtime) for CPU-only hosts"""
+
+    def __init__(self, model, processor):
+        self.model = model
+        self.processor = processor
+        tokenizer = self.processor.tokenizer
+        allowed_ids = {
+            token_id
+            for ids in tokenizer(keyword_variants(), add_special_tokens=False).input_ids
+            for token_id in ids
+        }
+        allowed_ids.add(tokenizer.eos_token_id)
+        self.logits_processor = LogitsProcessorList([AllowedTokensProcessor(allowed_ids)])
+
+        # Settled once here rather than merged from keyword arguments on
+        # every generate call
+        self.generation_config = copy.deepcopy(model.generation_config)
+        self.generation_config.max_new_tokens = MAX_NEW_TOKENS
+        self.generation_config.num_beams = 1
+        self.generation_config.do_sample = False
+        self.generation_config.use_cache = True
+        self.generation_config.language = "en"
+        self.generation_config.task = "transcribe"
+
+    def transcribe_batch(self, audio_arrays):
+        input_features = self.processor.feature_extractor(
+            list(audio_arrays),
+            sampling_rate=SAMPLE_RATE,
+            return_tensors="pt"
+        ).input_features
+        predicted_ids = self.model.generate(
+            input_features,
+            generation_config=self.generation_config,
+            logits_processor=self.logits_processor
+        )
+        return self.processor.batch_decode(predicted_ids, skip_special_tokens=True)
+
+def _create_recognizer():
+    if ctranslate2.get_cuda_device_count() > 0:
+        recognizer = CT2Recognizer()
+    elif os.path.isdir(ONNX_INT4_DIR):
+        # whisper-base with INT4 weight-only decoders: per-token decoding is
+        # bound by weight loads, which 4-bit weights cut to a quarter
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+
+        recognizer = OptimumRecognizer(
+            ORTModelForSpeechSeq2Seq.from_pretrained(
+                ONNX_INT4_DIR,
+                provider="CPUExecutionProvider",
+                use_merged=False
+            ),
+            AutoProcessor.from_pretrained(ONNX_INT4_DIR)
+        )
+    else:
+        # tiny-int8 is plenty for single-word commands and runs on int8 kernels
+        from optimum.intel.openvino import OVModelForSpeechSeq2Seq
+
+        recognizer = OptimumRecognizer(
+            OVModelForSpeechSeq2Seq.from_pretrained(OV_MODEL_ID),
+            AutoProcessor.from_pretrained(OV_MODEL_ID)
+        )
+    # One dummy pass so kernel selection, inference-request creation and
+    # buffer allocation happen before the first user waits on them
+    recognizer.transcribe_batch([np.zeros(SAMPLE_RATE, dtype=np.float32)])
+    return recognizer
+
+@st.cache_resource(show_spinner="Loading speech model...")
 def load_whisper_model():
-    return pipeline(
-        "automatic-speech-recognition",
-        model="openai/whisper-base"
+    # The process-level registry keeps a single resident copy even if the
+    # Streamlit resource cache is cleared or missed
+    return model_registry.get_or_create("whisper", _create_recognizer)
+
+class BatchCoalescer:
+    """Collect concurrent recordings and transcribe them in one batch"""
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self._pending = []
+        self._cond = threading.Condition(threading.Lock())
+        threading.Thread(target=self._run, name="whisper-batcher", daemon=True).start()
+
+    def submit(self, audio_array):
+        """Block until the recording has been transcribed and return its text"""
+        event = threading.Event()
+        result_slot = {}
+        with self._cond:
+            self._pending.append((audio_array, event, result_slot))
+            self._cond.notify()
+        event.wait()
+        if "error" in result_slot:
+            raise result_slot["error"]
+        return result_slot["text"]
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + BATCH_WINDOW_S
+            while len(self._pending) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:BATCH_SIZE]
+            del self._pending[:BATCH_SIZE]
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                texts = self.recognizer.transcribe_batch([audio for audio, _, _ in batch])
+            except Exception as exc:
+                for _, event, result_slot in batch:
+                    result_slot["error"] = exc
+                    event.set()
+                continue
+            for (_, event, result_slot), text in zip(batch, texts):
+                result_slot["text"] = text
+                event.set()
+
+@st.cache_resource
+def get_batcher():
+    # Registered alongside the model so a cleared cache never starts a
+    # second worker thread next to the first
+    return model_registry.get_or_create(
+        "batcher",
+        lambda: BatchCoalescer(load_whisper_model())
+    )
+
+def _to_mono(audio_array, n_channels):
+    """Downmix int16 frames to float32 mono in [-1, 1) with one allocation"""
+    if n_channels > 1:
+        # float32 sums of int16 samples are exact and, unlike mean(), avoid
+        # promoting the whole buffer to float64
+        audio_array = audio_array.reshape(-1, n_channels).sum(axis=1, dtype=np.float32)
+    else:
+        audio_array = audio_array.astype(np.float32)
+    audio_array *= 1.0 / (32768.0 * n_channels)
+    return audio_array
+
+def _parse_canonical_wav(audio_bytes):
+    """Read PCM16 audio straight after a canonical 44-byte header, or None"""
+    if len(audio_bytes) < _CANONICAL_WAV_HEADER.size:
+        return None
+    (riff_id, _, wave_id, fmt_id, fmt_size, audio_format, n_channels,
+     sample_rate, _, _, bits_per_sample, data_id, data_size) = _CANONICAL_WAV_HEADER.unpack_from(audio_bytes)
+    if (
+        (riff_id, wave_id, fmt_id, data_id) != (b"RIFF", b"WAVE", b"fmt ", b"data")
+        or fmt_size != 16
+        or audio_format != 1
+        or bits_per_sample != 16
+        or n_channels == 0
+    ):
+        return None
+
+    # Streaming writers may leave data_size unset, so clamp to what arrived
+    n_samples = min(data_size, len(audio_bytes) - _CANONICAL_WAV_HEADER.size) // 2
+    n_samples -= n_samples % n_channels
+    audio_array = np.frombuffer(
+        audio_bytes,
+        dtype=np.int16,
+        count=n_samples,
+        offset=_CANONICAL_WAV_HEADER.size
     )
+    return _to_mono(audio_array, n_channels), sample_rate
+
+def process_wav_bytes(audio_bytes):
+    """Decode 16-bit PCM WAV bytes into float32 mono audio and its rate"""
+    parsed = _parse_canonical_wav(audio_bytes)
+    if parsed is not None:
+        return parsed
+
+    with wave.open(io.BytesIO(audio_bytes)) as wav_file:
+        n_channels = wav_file.getnchannels()
+        samp_width = wav_file.getsampwidth()
+        sample_rate = wav_file.getframerate()
+        frames = wav_file.readframes(wav_file.getnframes())
+
+    if samp_width != 2:
+        raise wave.Error(f"Unsupported sample width: {samp_width * 8}-bit")
+    audio_array = np.frombuffer(frames, dtype=np.int16)
+    return _to_mono(audio_array, n_channels), sample_rate
+
+def load_audio(audio_bytes):
+    """Decode WAV bytes into 16 kHz mono float32 audio for Whisper"""
+    try:
+        audio_array, sample_rate = process_wav_bytes(audio_bytes)
+    except wave.Error:
+        # Not plain 16-bit PCM: let PyAV decode and resample it
+        return decode_audio(io.BytesIO(audio_bytes), sampling_rate=SAMPLE_RATE)
+
+    if sample_rate != SAMPLE_RATE:
+        audio_array = resample_poly(audio_array, SAMPLE_RATE, sample_rate).astype(np.float32, copy=False)
+    return audio_array
+
+def trim_silence(audio_array):
+    """Keep only the speech regions found by the Silero VAD"""
+    speech_timestamps = get_speech_timestamps(audio_array, VAD_OPTIONS)
+    if not speech_timestamps:
+        return audio_array[:0]
+    return np.concatenate([
+        audio_array[ts["start"]:ts["end"]] for ts in speech_timestamps
+    ])
+
+def _do_process(audio_bytes):
+    audio_array = trim_silence(load_audio(audio_bytes))
+    if not audio_array.size:
+        # Nothing but silence: skip the model instead of letting it guess
+        return ""
+    return clean_text(get_batcher().submit(audio_array))
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _transcribe_cached(digest, _audio_bytes):
+    # The underscore keeps Streamlit from hashing the raw bytes itself,
+    # so the 16-byte digest is the whole cache key
+    return _do_process(_audio_bytes)
 
 def process_audio(audio_bytes):
     """Handle audio processing with better text normalization"""
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-            tmp_file.write(audio_bytes)
-            tmp_path = tmp_file.name
-        
-        pipe = load_whisper_model()
-        result = pipe(tmp_path)
-        cleaned_text = clean_text(result["text"])
-        return cleaned_text
-    
-    finally:
-        if os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except PermissionError:
-                pass
+    digest = hashlib.blake2b(audio_bytes, digest_size=16).digest()
+    return _transcribe_cached(digest, audio_bytes)
+
+def process_audio_async(executor, audio_bytes):
+    """Run process_audio on this script run's executor and return its Future"""
+    ctx = get_script_run_ctx()
+
+    def run():
+        # Worker threads have no Streamlit context of their own; attach the
+        # caller's for the cached calls made inside process_audio
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return process_audio(audio_bytes)
+
+    return executor.submit(run)
+
+def quick_audio_key(audio_bytes):
+    """Cheap fingerprint: length plus an xxh3 hash of the first and last 4 KB"""
+    hasher = xxhash.xxh3_64(audio_bytes[:QUICK_HASH_BYTES])
+    hasher.update(audio_bytes[-QUICK_HASH_BYTES:])
+    return len(audio_bytes), hasher.intdigest()
+
+def submit_recognition(executor, source, audio_bytes):
+    """Start recognizing audio_bytes, reusing the last result from this source"""
+    key = quick_audio_key(audio_bytes)
+    last = st.session_state.get(f"last_{source}")
+    if last is not None and last[0] == key:
+        # Same input as the previous rerun: skip even the digest-keyed cache
+        future = Future()
+        future.set_result(last[1])
+    else:
+        future = process_audio_async(executor, audio_bytes)
+    return key, future
 
 def clean_text(text):
     """Normalize text for better matching"""
     # Remove punctuation and make lowercase
-    text = re.sub(r'[^\w\s]', '', text).strip().lower()
+    text = _PUNCT_RE.sub('', text).strip().lower()
     # Keep only single words
-    return text.split()[0] if text else ""
+    return text.split(None, 1)[0] if text else ""
 
 def main():
     st.title("🎤 Voice-Controlled Video Player")
     
-    # Audio recording
-    audio_bytes = audio_recorder()
-    if audio_bytes:
-        with st.spinner("Processing..."):
-            text = process_audio(audio_bytes)
-            if text:
-                show_results(text)
+    # Audio recording, captured at Whisper's rate so no resampling is needed
+    audio_bytes = audio_recorder(sample_rate=SAMPLE_RATE)
+    recording_results = st.container()
 
     # File upload
     audio_file = st.file_uploader("Upload audio", type=["wav"])
+    upload_results = st.container()
+
+    # Start every input before waiting on any, so they are processed
+    # concurrently instead of one after the other
+    jobs = []
+    if audio_bytes:
+        jobs.append(("recording", recording_results, audio_bytes))
     if audio_file:
-        with st.spinner("Processing..."):
-            text = process_audio(audio_file.read())
-            if text:
-                show_results(text)
+        jobs.append(("upload", upload_results, audio_file.read()))
+    if not jobs:
+        return
+
+    # One executor per script run, so a session only ever waits on its own
+    # inputs and concurrent sessions each reach the batcher independently
+    with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="audio-worker") as executor:
+        submitted = [
+            (source, results, *submit_recognition(executor, source, data))
+            for source, results, data in jobs
+        ]
+
+        for source, results, key, future in submitted:
+            with results, st.spinner("Processing..."):
+                text = future.result()
+                st.session_state[f"last_{source}"] = (key, text)
+                if text:
+                    show_results(text)
+
+@st.cache_resource
+def load_video_bytes():
+    # The clips are small and fixed, so read them once per process instead
+    # of having st.video reopen the file on every recognition
+    return {
+        word: Path(path).read_bytes()
+        for word, path in VIDEO_MAPPING.items()
+        if os.path.exists(path)
+    }
 
 def show_results(text):
     st.subheader("Results")
@@ -73,8 +435,9 @@ def show_results(text):
     
     # Check file existence
     if text in VIDEO_MAPPING:
-        if os.path.exists(VIDEO_MAPPING[text]):
-            st.video(VIDEO_MAPPING[text])
+        video_bytes = load_video_bytes().get(text)
+        if video_bytes is not None:
+            st.video(video_bytes, format="video/mp4")
             st.success(f"Playing video for: {text}")
         else:
             st.error(f"Video file not found: {VIDEO_MAPPING[text]}")
@@ -0,0 +1,23 @@
+"""Process-wide holder for objects that must outlive Streamlit reruns.
+
+Streamlit re-executes main.py in a fresh namespace on every rerun, and
+its file watcher drops local modules such as this one from sys.modules
+whenever a source file changes.  The registry itself is therefore kept
+on the sys module, which is never reloaded, so a re-imported copy of
+this module finds the same instances.
+"""
+import sys
+import threading
+
+# dict.setdefault is atomic, so concurrent first imports share one registry.
+# The lock is reentrant because one factory may fetch another entry.
+_lock, _instances = vars(sys).setdefault(
+    "_speech_to_video_registry", (threading.RLock(), {})
+)
+
+def get_or_create(key, factory):
+    """Return the object stored under key, building it with factory once"""
+    with _lock:
+        if key not in _instances:
+            _instances[key] = factory()
+        return _instances[key]